@@ -1,4 +1,8 @@
 import configparser
+import csv
+import time
+from queue import Queue
+from threading import Thread
 
 import pandas as pd
 import xarray as xr
@@ -6,6 +10,9 @@ import xarray as xr
 from lsw.utils import root
 
 
+sensors = {"Es": "8798", "Lw": "8799"}
+
+
 def load_background_data(path):
     return pd.read_csv(path, names=["Pixel", "B0", "B1", "Status"], sep=" ",
                        skiprows=39, skipfooter=3, dtype={"Pixel": int, "B0": float, "B1": float},
@@ -25,14 +32,28 @@ def load_ini(path):
             for coef in ("c0s", "c1s", "c2s", "c3s", "c4s")}
 
 
+def load_sensor(sensor_id):
+    return (
+        load_background_data(root / f"calibration_files/{sensor_id}/Back_SAM_{sensor_id}.dat"),
+        load_calibration_data(root / f"calibration_files/{sensor_id}/Cal_SAM_{sensor_id}.dat"),
+        load_ini(root / f"calibration_files/{sensor_id}/SAM_{sensor_id}.ini")
+    )
+
+
 def load_raw_data(path, df_back, df_cal, dict_ini):
     df = pd.read_csv(path, index_col="time", parse_dates=True)
+    df["ordinate"] = [eval(e) for e in df["ordinate"].values]
+    return calibrate(df, df_back, df_cal, dict_ini)
+
+
+def calibrate(df, df_back, df_cal, dict_ini):
+    """Calibrate RAW spectra (`df` indexed by time, with ordinate as lists)."""
     ds = xr.Dataset(
         {
             "integration_time": ("time", df["integration_time"]),
             "pre_inclination": ("time", df["pre_inclination"]),
             "post_inclination": ("time", df["post_inclination"]),
-            "In": (["time", "Pixel"], [eval(e) for e in df["ordinate"].values])
+            "In": (["time", "Pixel"], list(df["ordinate"].values))
         },
         coords = {
             "time": df.index,
@@ -69,11 +90,97 @@ def format_df(df):
     return pd.concat(lst, axis=1).dropna().transpose()
 
 
+def calibrated_path(path, out_dir):
+    return out_dir / str(path.name).replace("__RAW", "__CALIBRATED")
+
+
+class StreamingCalibration:
+    """
+    Calibrate RAW records in a background thread, appending them to a CALIBRATED file.
+
+    Records are dicts as written in RAW files (see `lsw.main_rad`), with ordinate as a list.
+    The CALIBRATED file is overwritten by the first record. If a record fails, the
+    partial file is removed (so that `lsw calibrate` redoes it), the following
+    records are dropped, and the error is raised again by `close`.
+    """
+    def __init__(self, path, sensor_id):
+        self.path = path
+        self.calibration = load_sensor(sensor_id)
+        self.error = None
+        self._queue = Queue()
+        self._thread = Thread(target=self._run)
+        self._thread.start()
+
+    def put(self, record):
+        self._queue.put(record)
+
+    def close(self):
+        """Wait for the pending records to be written."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Streaming calibration of {self.path.name} failed") from self.error
+
+    def _run(self):
+        header = True
+        while (record := self._queue.get()) is not None:
+            if self.error is not None:
+                continue
+            try:
+                df = pd.DataFrame([record]).set_index("time")
+                df.index = pd.to_datetime(df.index)
+                df = calibrate(df, *self.calibration)
+                format_df(df).to_csv(self.path, mode="w" if header else "a", header=header)
+                header = False
+            except Exception as e:
+                print(f"Streaming calibration of {self.path.name} failed: {e!r}")
+                self.error = e
+                self.path.unlink(missing_ok=True)
+
+
+def tail(f, idle_timeout=None):
+    """Yield the complete lines of `f` as they are written, until `idle_timeout` seconds pass without one (None: never)."""
+    line = ""
+    last = time.monotonic()
+    while True:
+        line += f.readline()
+        if not line.endswith("\n"):    # no new (complete) line yet
+            if idle_timeout is not None and time.monotonic() - last > idle_timeout:
+                return
+            time.sleep(1)
+            continue
+        yield line
+        line = ""
+        last = time.monotonic()
+
+
+def follow(path, sensor_id, out_dir, idle_timeout=None):
+    """
+    Calibrate a RAW file as it is written, starting with the records already in it.
+
+    Stops after `idle_timeout` seconds without a new record (None: never).
+    """
+    calibration = StreamingCalibration(calibrated_path(path, out_dir), sensor_id)
+    try:
+        with open(path, newline="") as f:
+            lines = tail(f, idle_timeout)
+            header = next(lines, None)
+            if header is None:  # not written within idle_timeout
+                return
+            fieldnames = next(csv.reader([header]))
+            for line in lines:
+                row = next(csv.DictReader([line], fieldnames=fieldnames))
+                calibration.put({
+                    "time": row["time"],
+                    "integration_time": float(row["integration_time"]),
+                    "pre_inclination": float(row["pre_inclination"]),
+                    "post_inclination": float(row["post_inclination"]),
+                    "ordinate": eval(row["ordinate"]),
+                })
+    finally:
+        calibration.close()
+
+
 def main(path, sensor_id, out_dir):
-    df = load_raw_data(
-        path,
-        load_background_data(root / f"calibration_files/{sensor_id}/Back_SAM_{sensor_id}.dat"),
-        load_calibration_data(root / f"calibration_files/{sensor_id}/Cal_SAM_{sensor_id}.dat"),
-        load_ini(root / f"calibration_files/{sensor_id}/SAM_{sensor_id}.ini")
-    )
-    format_df(df).to_csv(out_dir / str(path.name).replace("__RAW", "__CALIBRATED"))
+    df = load_raw_data(path, *load_sensor(sensor_id))
+    format_df(df).to_csv(calibrated_path(path, out_dir))
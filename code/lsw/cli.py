@@ -1,25 +1,13 @@
 import subprocess
-from multiprocessing import Process
 from pathlib import Path
+from typing import Optional
 
 import typer
 from typing_extensions import Annotated
 
-from lsw.gps_time import main as set_time
-from lsw.main_geo import main as main_g
-from lsw.main_rad import main as main_r
-from lsw.calibrate import main as main_c
+from lsw.calibrate import follow as main_f, main as main_c, sensors
 from lsw.plot import main as main_p
-
-
-def f1(_tuple):
-    station, out_dir = _tuple
-    main_g(station, out_dir / "geo")
-
-
-def f2(_tuple):
-    station, n_spectra, out_dir = _tuple
-    main_r(station, n_spectra, out_dir / "rad/raw")
+from lsw.startup import main as main_s
 
 
 app = typer.Typer()
@@ -31,22 +19,18 @@ def start(
         n_spectra: Annotated[int, typer.Option("--nb-spectra", "-n", help="How many spectra to measure")] = 24,
         out_dir: Annotated[Path, typer.Option("--out-dir", "-o", exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Output directory")] = Path.home() / "LSW_data",
         rotate: Annotated[bool, typer.Option("--rotate/--no-rotation", "-r", help="Make Lw sensor face the Sun")] = True,
+        fix_timeout: Annotated[Optional[float], typer.Option("--fix-timeout", "-t", help="How long to wait for a GPS fix, in seconds (default: forever)")] = None,
+        calibrate: Annotated[bool, typer.Option("--calibrate/--no-calibrate", "-c", help="Calibrate spectra as they are measured")] = False,
     ):
     """
     Start the Rrs measurements.
 
     If --no-rotation is used, the Lw radiometer won't automatically face the Sun.
+    If no GPS fix is obtained within --fix-timeout, the system clock is left unchanged
+    and the Lw radiometer won't face the Sun either.
+    If --calibrate is used, calibrated spectra are written to <out-dir>/rad/calibrated during the measurements.
     """
-    set_time()
-    if rotate:
-        p1 = Process(target=f1, args=((station, out_dir),))
-        p1.start()
-    p2 = Process(target=f2, args=((station, n_spectra, out_dir),))
-    p2.start()
-    p2.join()
-    if rotate:
-        p1.terminate()  # SIGTERM
-        p1.join()
+    main_s(station, n_spectra, out_dir, rotate, fix_timeout, calibrate)
 
 
 @app.command()
@@ -69,6 +53,22 @@ def calibrate(
         main_c(path, "8799", out_dir)
 
 
+@app.command()
+def follow(
+        path: Annotated[Path, typer.Argument(exists=True, file_okay=True, dir_okay=False, resolve_path=True, help="RAW file to calibrate")],
+        out_dir: Annotated[Path, typer.Option("--out-dir", "-o", exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Output directory")] = Path.home() / "LSW_data/rad/calibrated",
+        idle_timeout: Annotated[Optional[float], typer.Option("--idle-timeout", "-t", help="Stop after this many seconds without new spectra (default: never)")] = None,
+    ):
+    """
+    Apply sensor calibration to a RAW file as it is written.
+
+    Spectra already in the file are calibrated first, then new ones as they are appended.
+    """
+    if path.name[:2] not in sensors:
+        raise typer.BadParameter(f"file name must start with one of {', '.join(sensors)}", param_hint="PATH")
+    main_f(path, sensors[path.name[:2]], out_dir, idle_timeout)
+
+
 @app.command()
 def draw(in_dir1: Annotated[Path, typer.Option(exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Input directory for radiometry")] = Path.home() / "LSW_data/rad/calibrated",
          in_dir2: Annotated[Path, typer.Option(exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Input directory for geometry")] = Path.home() / "LSW_data/geo",
@@ -94,6 +94,16 @@ def shutdown():
 
 
 @app.command()
-def visual():
-    """TODO: Launch the dashboard for data post-processing and visualisation."""
-    pass    # TODO
+def visual(in_dir1: Annotated[Path, typer.Option(exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Input directory for radiometry")] = Path.home() / "LSW_data/rad/calibrated",
+           in_dir2: Annotated[Path, typer.Option(exists=True, file_okay=False, dir_okay=True, resolve_path=True, help="Input directory for geometry")] = Path.home() / "LSW_data/geo",
+           tiles_dir: Annotated[Path, typer.Option("--tiles-dir", "-t", file_okay=False, dir_okay=True, resolve_path=True, help="Directory of the precomputed summaries")] = Path.home() / "LSW_data/tiles",
+           port: Annotated[int, typer.Option("--port", "-p", help="Port of the dashboard")] = 8050,
+           force: Annotated[bool, typer.Option("--force/--no-force", "-f", help="Recompute existing summaries")] = False,
+    ):
+    """
+    Launch the dashboard for data post-processing and visualisation.
+
+    Summaries of the sessions not processed yet are computed before the dashboard starts.
+    """
+    from lsw.dashboard import main as main_v    # Dash is slow to import: only load it here
+    main_v(in_dir1, in_dir2, tiles_dir, port, force)
@@ -0,0 +1,246 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from dash import Dash, Input, Output, dcc, html
+from dash.exceptions import PreventUpdate
+from scipy.spatial.transform import Rotation as R
+
+from lsw.plot import create_fig, load_ori_data, load_rad_data
+
+
+MAX_ORI = 500   # orientation samples kept per session
+TILT_BINS = np.arange(0, 10.5, 0.5)     # [°]
+RESOLUTIONS = ("session", "daily")
+TOLERANCE = pd.Timedelta(minutes=2)     # between the start times of the files of a session
+
+
+# Tiles
+
+def session_name(path):
+    """Session (station and start time) of a radiometry or orientation file."""
+    return "_".join(path.stem.split("__")[0].split("_")[1:])
+
+
+def session_time(session):
+    return pd.to_datetime(session.split("_")[-1], format="%Y%m%dT%H%M")
+
+
+def session_station(session):
+    return session.rsplit("_", 1)[0]
+
+
+def match_session(session, paths):
+    """Return the file of `paths` (by session) of the same station started closest to `session`, if any."""
+    candidates = [(abs(session_time(other) - session_time(session)), other) for other in paths
+                  if session_station(other) == session_station(session)]
+    if candidates:
+        delta, other = min(candidates)
+        if delta <= TOLERANCE:
+            return paths[other]
+    return None
+
+
+def make_tiles(session, path_Es, path_Lw, path_ori, out_dir):
+    """
+    Write the Rrs spectra and the downsampled orientation (if `path_ori` is not None) of a session.
+
+    Return its mean Rrs spectrum and its tilt histogram (NaN without orientation).
+    """
+    df_rrs = load_rad_data(path_Lw) / load_rad_data(path_Es)
+    df_rrs.to_csv(out_dir / f"rrs/{session}.csv")
+    if path_ori is None:
+        (out_dir / f"ori/{session}.csv").unlink(missing_ok=True)
+        return df_rrs.mean().rename(session), pd.Series(np.nan, index=TILT_BINS[:-1], name=session)
+    df_ori = load_ori_data(path_ori)
+    step = max(1, len(df_ori) // MAX_ORI)
+    df_ori.iloc[::step][["x", "y", "z", "w", "theta_sun", "theta_sun_norm", "theta", "phi"]].to_csv(out_dir / f"ori/{session}.csv")
+    hist, _ = np.histogram(df_ori.theta.clip(upper=TILT_BINS[-1]), bins=TILT_BINS)
+    return df_rrs.mean().rename(session), pd.Series(hist, index=TILT_BINS[:-1], name=session)
+
+
+def list_files(in_dir1, in_dir2, out_dir, force=False):
+    """
+    Return (session, Es, Lw, orientation) files of the sessions to tile, starting from the Es files.
+
+    Lw and orientation files are matched by station and closest start time;
+    sessions without Lw are skipped, and those without orientation have no tilt.
+    Unless `force` is True, sessions already tiled are left out, except those
+    tiled without orientation whose orientation file is now available.
+    """
+    path_Lw = {session_name(path): path for path in in_dir1.glob("Lw*__CALIBRATED.csv")}
+    path_ori = {session_name(path): path for path in in_dir2.glob("ori*.csv")}
+    existing_rrs = {path.stem for path in (out_dir / "rrs").glob("*.csv")}
+    existing_ori = {path.stem for path in (out_dir / "ori").glob("*.csv")}
+    sessions = []
+    for path_Es in sorted(in_dir1.glob("Es*__CALIBRATED.csv")):
+        session = session_name(path_Es)
+        path_ori_ = match_session(session, path_ori)
+        if not force and session in existing_rrs and (path_ori_ is None or session in existing_ori):
+            continue
+        path_Lw_ = match_session(session, path_Lw)
+        if path_Lw_ is None:
+            print(f"{session}: no Lw file, skipped")
+            continue
+        if path_ori_ is None:
+            print(f"{session}: no orientation file, tilt left empty")
+        sessions.append((session, path_Es, path_Lw_, path_ori_))
+    return sessions
+
+
+def update_summary(path, rows):
+    df = pd.DataFrame(rows)
+    df.columns = df.columns.astype(float)
+    if path.exists():
+        df_old = read_summary(path)
+        df = pd.concat([df_old.drop(df.index, errors="ignore"), df])
+    df.loc[sorted(df.index, key=session_time)].to_csv(path)
+    read_summary.cache_clear()
+
+
+def build_tiles(in_dir1, in_dir2, out_dir, force=False):
+    """Precompute the summaries displayed by the dashboard, for the sessions not processed yet."""
+    (out_dir / "rrs").mkdir(parents=True, exist_ok=True)
+    (out_dir / "ori").mkdir(exist_ok=True)
+    sessions = list_files(in_dir1, in_dir2, out_dir, force)
+    if not sessions:
+        return
+    rows_rrs, rows_tilt = zip(*(make_tiles(*files, out_dir) for files in sessions))
+    update_summary(out_dir / "rrs_session.csv", rows_rrs)
+    update_summary(out_dir / "tilt_session.csv", rows_tilt)
+    df = read_summary(out_dir / "rrs_session.csv")
+    df.groupby(df.index.map(lambda session: session_time(session).date().isoformat())).mean().to_csv(out_dir / "rrs_daily.csv")
+
+
+# Queries
+
+@lru_cache(maxsize=8)
+def read_summary(path):
+    df = pd.read_csv(path, index_col=0)
+    df.columns = df.columns.astype(float)
+    return df
+
+
+@lru_cache(maxsize=64)
+def read_rrs(path):
+    df = pd.read_csv(path, index_col=0, parse_dates=True)
+    df.columns = df.columns.astype(float)
+    return df
+
+
+@lru_cache(maxsize=64)
+def read_ori(path):
+    df = pd.read_csv(path, index_col="date_time", parse_dates=True)
+    df["r_Lu"] = df.apply(lambda row: R.from_quat((row.x, row.y, row.z, row.w)), axis=1)
+    return df
+
+
+def list_days(tiles_dir):
+    path = tiles_dir / "rrs_daily.csv"
+    return read_summary(path).index.tolist() if path.exists() else []
+
+
+@lru_cache(maxsize=256)
+def list_sessions(tiles_dir, day):
+    df = read_summary(tiles_dir / "rrs_session.csv")
+    return [session for session in df.index if session_time(session).date().isoformat() == day]
+
+
+@lru_cache(maxsize=256)
+def query_spectra(tiles_dir, day, session=None):
+    """Rrs spectra of a session, or mean Rrs spectra of the sessions of a day."""
+    if session is not None:
+        return read_rrs(tiles_dir / f"rrs/{session}.csv")
+    return read_summary(tiles_dir / "rrs_session.csv").loc[list_sessions(tiles_dir, day)]
+
+
+@lru_cache(maxsize=256)
+def query_ori(tiles_dir, day, session=None):
+    """Downsampled orientation of a session or of a day (None if there is none)."""
+    sessions = [session] if session is not None else list_sessions(tiles_dir, day)
+    paths = [tiles_dir / f"ori/{session}.csv" for session in sessions]
+    paths = [path for path in paths if path.exists()]
+    return pd.concat([read_ori(path) for path in paths]) if paths else None
+
+
+@lru_cache(maxsize=256)
+def query_tilt(tiles_dir, day, session=None):
+    sessions = [session] if session is not None else list_sessions(tiles_dir, day)
+    return read_summary(tiles_dir / "tilt_session.csv").loc[sessions].sum(min_count=1)
+
+
+@lru_cache(maxsize=256)
+def query_timeseries(tiles_dir, resolution, wavelength):
+    df = read_summary(tiles_dir / f"rrs_{resolution}.csv")
+    index = df.index.map(session_time) if resolution == "session" else pd.to_datetime(df.index)
+    return pd.Series(df[float(wavelength)].values, index=index)
+
+
+# Figures
+
+def draw_tilt_histogram(hist):
+    fig = go.Figure(go.Bar(x=hist.index + (TILT_BINS[1] - TILT_BINS[0]) / 2, y=hist.values,
+                           marker_color="rgb(102, 102, 102)"))
+    fig.update_xaxes(title_text="tilt [°]")
+    fig.update_yaxes(title_text="count")
+    fig.update_layout(template="simple_white", bargap=0.05)
+    return fig
+
+
+def draw_timeseries(series, wavelength):
+    fig = go.Figure(go.Scatter(x=series.index, y=series.values, mode="lines+markers",
+                               line_color="rgb(102, 102, 102)"))
+    fig.update_yaxes(title_text=f"R<sub>rs</sub>({wavelength} nm) [sr<sup>-1</sup>]")
+    fig.update_layout(template="simple_white")
+    return fig
+
+
+# Application
+
+def create_app(tiles_dir):
+    days = list_days(tiles_dir)
+    app = Dash(__name__, title="Lake SkyWater")
+    app.layout = html.Div([
+        html.Div([
+            dcc.Dropdown(days, days[-1] if days else None, id="day", clearable=False),
+            dcc.Dropdown(id="session", placeholder="All sessions of the day"),
+        ], style={"display": "grid", "gridTemplateColumns": "1fr 1fr", "gap": "1em"}),
+        dcc.Graph(id="overview"),
+        dcc.Graph(id="tilt"),
+        html.Div([
+            dcc.RadioItems(RESOLUTIONS, "daily", id="resolution", inline=True),
+            dcc.Slider(320, 950, 10, value=560, id="wavelength", marks=None,
+                       tooltip={"placement": "bottom", "always_visible": True}),
+        ]),
+        dcc.Graph(id="timeseries"),
+    ])
+
+    @app.callback(Output("session", "options"), Output("session", "value"), Input("day", "value"))
+    def update_sessions(day):
+        if day is None:
+            raise PreventUpdate
+        return list_sessions(tiles_dir, day), None
+
+    @app.callback(Output("overview", "figure"), Output("tilt", "figure"),
+                  Input("day", "value"), Input("session", "value"))
+    def update_session(day, session):
+        if day is None:
+            raise PreventUpdate
+        # draw_tilt modifies the orientation data: never hand it the cached DataFrame
+        df_ori = query_ori(tiles_dir, day, session)
+        fig = create_fig(query_spectra(tiles_dir, day, session), None if df_ori is None else df_ori.copy(), session or day)
+        return fig, draw_tilt_histogram(query_tilt(tiles_dir, day, session))
+
+    @app.callback(Output("timeseries", "figure"), Input("resolution", "value"), Input("wavelength", "value"))
+    def update_timeseries(resolution, wavelength):
+        if not days:
+            raise PreventUpdate
+        return draw_timeseries(query_timeseries(tiles_dir, resolution, wavelength), wavelength)
+
+    return app
+
+
+def main(in_dir1, in_dir2, tiles_dir, port=8050, force=False):
+    build_tiles(in_dir1, in_dir2, tiles_dir, force)
+    create_app(tiles_dir).run(port=port)
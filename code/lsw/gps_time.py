@@ -4,28 +4,40 @@ import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import pandas as pd
-from tinkerforge.ip_connection import IPConnection
-from tinkerforge.bricklet_gps_v2 import BrickletGPSV2
 
+from lsw.hub import DeviceHub
 
-HOST = "localhost"
-PORT = 4223
-UID_GPS = "PuF"
-
-
-def main():
-    ipcon = IPConnection() # Create IP connection
-    gps = BrickletGPSV2(UID_GPS, ipcon)  # Create device object
-
-    ipcon.connect(HOST, PORT) # Connect to brickd
 
+def wait_for_fix(gps, timeout=None):
+    """Wait until the GPS has a fix, or until `timeout` seconds have elapsed (None: wait forever)."""
+    start = time.monotonic()
     while not gps.get_status()[0]:
+        if timeout is not None and time.monotonic() - start > timeout:
+            return False
         time.sleep(1)
-    _date, _time = gps.get_date_time()
-    datetime = pd.to_datetime(f"{_date}{_time}", format="%d%m%y%H%M%S%f").isoformat(sep=" ", timespec="seconds")
-    subprocess.run(["sudo", "timedatectl", "set-time", datetime])
-    result = subprocess.run(["timedatectl", "status"], capture_output=True, text=True)
-    print(result.stdout)
+    return True
+
+
+def main(hub=None, timeout=None):
+    own_hub = hub is None
+    if own_hub:
+        hub = DeviceHub()
+        hub.connect()
+    gps = hub.gps
+
+    try:
+        if not wait_for_fix(gps, timeout):
+            print(f"No GPS fix after {timeout} s, system time left unchanged")
+            return False
+        _date, _time = gps.get_date_time()
+        datetime = pd.to_datetime(f"{_date}{_time}", format="%d%m%y%H%M%S%f").isoformat(sep=" ", timespec="seconds")
+        subprocess.run(["sudo", "timedatectl", "set-time", datetime])
+        result = subprocess.run(["timedatectl", "status"], capture_output=True, text=True)
+        print(result.stdout)
+        return True
+    finally:
+        if own_hub:
+            hub.disconnect()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+from tinkerforge.ip_connection import IPConnection
+from tinkerforge.brick_silent_stepper import BrickSilentStepper
+from tinkerforge.bricklet_gps_v2 import BrickletGPSV2
+from tinkerforge.bricklet_imu_v3 import BrickletIMUV3
+from tinkerforge.bricklet_rs485 import BrickletRS485
+
+from lsw.state import LatestState
+
+
+HOST = "localhost"
+PORT = 4223
+UID_GPS = "PuF"
+UID_IMU = "ZH8"
+UID_SS = "68wJ5h"   # silent stepper
+UID_Ed = "24Ry"
+UID_Lu = "28Dt"
+
+TOPICS = ("coordinates", "quaternion", "Ed", "Lu")
+
+
+class DeviceHub:
+    """
+    Own the connection to brickd and every device of the system.
+
+    Messages (GPS coordinates, IMU quaternions, decoded spectra) are passed to
+    the handlers registered with `on`. The latest orientation and position are
+    also kept in `state`, a shared memory buffer that can be read from any
+    process without copies.
+    """
+    def __init__(self, host=HOST, port=PORT):
+        self.host = host
+        self.port = port
+        self.ipcon = IPConnection() # Create IP connection
+        self.gps = BrickletGPSV2(UID_GPS, self.ipcon)  # Create device object
+        self.imu = BrickletIMUV3(UID_IMU, self.ipcon) # Create device object
+        self.ss = BrickSilentStepper(UID_SS, self.ipcon)  # Create device object
+        self.rs485_Ed = BrickletRS485(UID_Ed, self.ipcon) # Create device object
+        self.rs485_Lu = BrickletRS485(UID_Lu, self.ipcon) # Create device object
+        self.state = LatestState()
+        self._handlers = {topic: [] for topic in TOPICS}
+
+        self.gps.register_callback(self.gps.CALLBACK_COORDINATES,
+                                   lambda *args: self.publish("coordinates", *args))
+        self.imu.register_callback(self.imu.CALLBACK_QUATERNION,
+                                   lambda *args: self.publish("quaternion", *args))
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.disconnect()
+
+    def connect(self):
+        self.ipcon.connect(self.host, self.port) # Connect to brickd
+        # Don't use device before ipcon is connected
+
+    def disconnect(self):
+        self.ipcon.disconnect()
+        self.state.close()
+
+    def on(self, topic, handler):
+        """Call `handler(*message)` for every message published on `topic`."""
+        self._handlers[topic].append(handler)
+
+    def off(self, topic, handler):
+        self._handlers[topic].remove(handler)
+
+    def publish(self, topic, *message):
+        for handler in self._handlers[topic]:
+            handler(*message)
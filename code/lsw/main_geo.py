@@ -5,21 +5,13 @@ import numpy as np
 import pandas as pd
 from pvlib.solarposition import get_solarposition
 from scipy.spatial.transform import Rotation as R
-from tinkerforge.ip_connection import IPConnection
-from tinkerforge.brick_silent_stepper import BrickSilentStepper
-from tinkerforge.bricklet_gps_v2 import BrickletGPSV2
-from tinkerforge.bricklet_imu_v3 import BrickletIMUV3
 
-from lsw.utils import lnle2ll, tfq2spq, normalize_angle
+from lsw.hub import DeviceHub
+from lsw.utils import get_2Dtilt, lnle2ll, tfq2spq, normalize_angle
 
 
-HOST = "localhost"
-PORT = 4223
-UID_GPS = "PuF"
-UID_IMU = "ZH8"
-UID_SS = "68wJ5h"   # silent stepper
-
 # global variables
+_hub = None
 gps = None
 ss = None
 r_sun = None
@@ -65,8 +57,10 @@ def cb_coordinates(latitude, ns, longitude, ew):
 
     SAA, ttime, altitude = _get_solar_azimuth(latitude, ns, longitude, ew)
     r_sun = R.from_euler("z", normalize_angle(SAA), degrees=True)
+    lat, lon = lnle2ll(latitude, ns, longitude, ew)
+    _hub.state.write(theta_sun=SAA, latitude=lat, longitude=lon, altitude=altitude)
 
-    f_pos.write(f"{','.join((ttime.isoformat(), *(str(e) for e in lnle2ll(latitude, ns, longitude, ew)), altitude))}\n")
+    f_pos.write(f"{','.join((ttime.isoformat(), *(str(e) for e in (lat, lon, altitude))))}\n")
 
 
 def cb_quaternion(w, x, y, z):
@@ -82,21 +76,31 @@ def cb_quaternion(w, x, y, z):
         nb_steps = int(r.as_euler("zyx", degrees=True)[0] / step_angle * Z)    # anticlockwise rotation
         ss.set_steps(nb_steps)
 
-    f_ori.write(f"{','.join((pd.Timestamp.now().isoformat(), *(str(e) for e in r_Lu.as_quat())))}\n")
+    theta, phi = get_2Dtilt(np.dot(r_Lu.as_matrix(), np.array([0, 0, 1])))
+    _hub.state.write(**dict(zip("xyzw", r_Lu.as_quat())), theta=theta, phi=phi)
 
+    f_ori.write(f"{','.join((pd.Timestamp.now().isoformat(), *(str(e) for e in r_Lu.as_quat())))}\n")
 
-def main(station, out_dir):
-    global gps, ss, r_sun, f_pos, f_ori
-    
-    killer = GracefulKiller()
 
-    ipcon = IPConnection() # Create IP connection
-    gps = BrickletGPSV2(UID_GPS, ipcon)  # Create device object
-    imu = BrickletIMUV3(UID_IMU, ipcon) # Create device object
-    ss = BrickSilentStepper(UID_SS, ipcon)  # Create device object
+def main(station, out_dir, hub=None, stop=None):
+    """
+    Make the Lu radiometer face the Sun and log position and orientation.
 
-    ipcon.connect(HOST, PORT) # Connect to brickd
-    # Don't use device before ipcon is connected
+    When `hub` is given, it must already be connected and is left open.
+    When `stop` (a threading.Event) is given, tracking runs until it is set,
+    which allows running in a thread; otherwise it runs until SIGINT/SIGTERM.
+    """
+    global _hub, gps, ss, r_sun, f_pos, f_ori
+    
+    killer = GracefulKiller() if stop is None else None
+    own_hub = hub is None
+    if own_hub:
+        hub = DeviceHub()
+        hub.connect()
+    _hub = hub
+    gps = hub.gps
+    imu = hub.imu
+    ss = hub.ss
 
     ss.set_motor_current(1580) # 1.58 A
     ss.set_step_configuration(ss.STEP_RESOLUTION_1, False) # 1 step (not interpolated)
@@ -107,23 +111,27 @@ def main(station, out_dir):
     ss.set_speed_ramping(500, 2000)
 
     # Get current coordinates
-    r_sun = R.from_euler("z", normalize_angle(get_solar_azimuth()), degrees=True)
+    SAA = get_solar_azimuth()
+    r_sun = R.from_euler("z", normalize_angle(SAA), degrees=True)
+    hub.state.write(theta_sun=SAA)
 
     # Initialisation
     ss.enable() # Enable motor power
 
-    gps.register_callback(gps.CALLBACK_COORDINATES, cb_coordinates)
-    imu.register_callback(imu.CALLBACK_QUATERNION, cb_quaternion)
+    hub.on("coordinates", cb_coordinates)
+    hub.on("quaternion", cb_quaternion)
 
     with open(out_dir / f"position_{station}_{pd.Timestamp.now().strftime('%Y%m%dT%H%M')}.csv", "a") as f_pos, open(out_dir / f"orientation_{station}_{pd.Timestamp.now().strftime('%Y%m%dT%H%M')}.csv", "a") as f_ori:
         f_pos.write("date_time,latitude,longitude,altitude\n")
         f_ori.write("date_time,x,y,z,w\n")
         gps.set_coordinates_callback_period(60000)  # set callback period to 1 m (60*1000 ms)
         imu.set_quaternion_callback_configuration(400, False)    # set callback period to 400 ms
-        while not killer.kill_now:
+        while not (killer.kill_now if stop is None else stop.is_set()):
             time.sleep(1)
         imu.set_quaternion_callback_configuration(0, False)   # turns the callback off
         gps.set_coordinates_callback_period(0)  # turns the callback off
+        hub.off("quaternion", cb_quaternion)
+        hub.off("coordinates", cb_coordinates)
         cb_coordinates(*gps.get_coordinates())
 
     # Stop motor before disabling motor power
@@ -132,4 +140,5 @@ def main(station, out_dir):
     time.sleep(0.4) # Wait for motor to actually stop: max velocity (2000 steps/s) / decceleration (5000 steps/s^2) = 0.4 s
     ss.disable() # Disable motor power
 
-    ipcon.disconnect()
+    if own_hub:
+        hub.disconnect()
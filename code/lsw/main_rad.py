@@ -1,80 +1,117 @@
 import time
-from threading import Thread
+from threading import Thread, Timer
 
 import pandas as pd
 from rich import print
 from rich.progress import track
-from tinkerforge.ip_connection import IPConnection
-from tinkerforge.bricklet_rs485 import BrickletRS485
 
+from lsw.calibrate import StreamingCalibration, calibrated_path, sensors
+from lsw.hub import DeviceHub
+from lsw.state import FIELDS
 from lsw.utils import addresses, process_data, set_configuration
 
 
-HOST = "localhost"
-PORT = 4223
-UID_Ed = "24Ry"
-UID_Lu = "28Dt"
+WARM_UP = 4.096     # [s] delay before the first spectrum can be read
+HEADER = ",".join(("time", "integration_time", "length", "pre_inclination", "post_inclination", "ordinate", *FIELDS))
 
 
 # Global variables
 
+_hub = None
+
 rs485_Ed = None
 Ed_address = None
 Ed_byte = None
 Ed_expected_request_id = None
+Ed_state = None
 
 rs485_Lu = None
 Lu_address = None
 Lu_byte = None
 Lu_expected_request_id = None
+Lu_state = None
 
 n_Ed = 0
 n_Lu = 0
+warming_up = False
 
 path_Ed = None
 path_Lu = None
 
 
+# Requests
+# (delayed requests are sent from a Timer: the callback thread is shared with
+# Sun tracking through the hub, and must never sleep)
+
+RETRY = 0.256   # [s] delay before retrying a request
+
+
+def trigger_Ed():
+    global Ed_expected_request_id
+
+    Ed_expected_request_id = rs485_Ed.modbus_master_write_single_register(2, 2, 1024)   # trigger measurement
+
+
+def trigger_Lu():
+    global Lu_expected_request_id
+
+    Lu_expected_request_id = rs485_Lu.modbus_master_write_single_register(1, 2, 1024)   # trigger measurement
+
+
+def read_Ed():
+    global Ed_expected_request_id
+
+    Ed_expected_request_id = rs485_Ed.modbus_master_read_holding_registers(2, Ed_address, Ed_byte)
+
+
+def read_Lu():
+    global Lu_expected_request_id
+
+    Lu_expected_request_id = rs485_Lu.modbus_master_read_holding_registers(1, Lu_address, Lu_byte)
+
+
 # Callbacks
 
 def cb_write_single_register_Ed(request_id, exception_code):
-    global Ed_address, Ed_address_queue, Ed_byte, Ed_byte_queue, Ed_data, Ed_expected_request_id, n_Ed
+    global Ed_address, Ed_address_queue, Ed_byte, Ed_byte_queue, Ed_data, Ed_expected_request_id, Ed_state, n_Ed
 
     print(f"Ed Measurement (id: {request_id}, EC: {exception_code})")
     if request_id != Ed_expected_request_id:
         print(f"Ed Error: Unexpected request ID ({Ed_expected_request_id})")
-        time.sleep(0.256)
-        Ed_expected_request_id = rs485_Ed.modbus_master_write_single_register(2, 2, 1024)   # trigger measurement
+        Timer(RETRY, trigger_Ed).start()
     else:
         Ed_data = {"time": pd.Timestamp.now().isoformat(timespec="seconds")}
+        Ed_state = _hub.state.read()     # orientation and position when the measurement is triggered
         Ed_address = 2006
         Ed_address_queue = [3109, 2985, 2861, 2737, 2613, 2016, 2014, 2010]
         Ed_byte = 1
         Ed_byte_queue = [14, 124, 124, 124, 124, 2, 2, 2]
         if n_Ed == 0:
-            time.sleep(4.096)
             n_Ed += 1
-        Ed_expected_request_id = rs485_Ed.modbus_master_read_holding_registers(2, Ed_address, Ed_byte)
+            Timer(WARM_UP, read_Ed).start()
+        else:
+            read_Ed()
 
 
 def cb_write_single_register_Lu(request_id, exception_code):
-    global Lu_address, Lu_address_queue, Lu_byte, Lu_byte_queue, Lu_data, Lu_expected_request_id, n_Lu
+    global Lu_address, Lu_address_queue, Lu_byte, Lu_byte_queue, Lu_data, Lu_expected_request_id, Lu_state, n_Lu
 
     print(f"Lu Measurement (id: {request_id}, EC: {exception_code})")
     if request_id != Lu_expected_request_id:
         print(f"Lu Error: Unexpected request ID ({Lu_expected_request_id})")
-        time.sleep(0.256)
-        Lu_expected_request_id = rs485_Lu.modbus_master_write_single_register(1, 2, 1024)   # trigger measurement
+        Timer(RETRY, trigger_Lu).start()
     else:
         Lu_data = {"time": pd.Timestamp.now().isoformat(timespec="seconds")}
+        Lu_state = _hub.state.read()     # orientation and position when the measurement is triggered
         Lu_address = 2006
         Lu_address_queue = [3109, 2985, 2861, 2737, 2613, 2016, 2014, 2010]
         Lu_byte = 1
         Lu_byte_queue = [14, 124, 124, 124, 124, 2, 2, 2]
         if n_Lu == 0:
-            time.sleep(4.096)
             n_Lu += 1
-        Lu_expected_request_id = rs485_Lu.modbus_master_read_holding_registers(1, Lu_address, Lu_byte)
+            Timer(WARM_UP, read_Lu).start()
+        else:
+            read_Lu()
 
 
 def cb_read_Ed(request_id, exception_code, holding_registers):
@@ -84,19 +121,21 @@ def cb_read_Ed(request_id, exception_code, holding_registers):
     if exception_code == 0:     # success
         Ed_data[addresses[Ed_address]] = holding_registers
         if Ed_address == 3109:
-            pd.DataFrame([process_data(Ed_data)]).set_index("time").to_csv(path_Ed, mode="a", header=False)  # Write Ed data on disk
+            if not warming_up:  # the warm-up spectrum is discarded
+                record = {**process_data(Ed_data), **Ed_state}
+                pd.DataFrame([record]).set_index("time").to_csv(path_Ed, mode="a", header=False)  # Write Ed data on disk
+                _hub.publish("Ed", record)
             Ed_busy = False
         else:
             Ed_address = Ed_address_queue.pop()
             Ed_byte = Ed_byte_queue.pop()
-            Ed_expected_request_id = rs485_Ed.modbus_master_read_holding_registers(2, Ed_address, Ed_byte)
+            read_Ed()
     else:
         if request_id != Ed_expected_request_id:
             print(f"Ed Error: Unexpected request ID ({Ed_expected_request_id})")
         elif exception_code == 6:
             print("Ed sensor is busy")
-        time.sleep(0.256)
-        Ed_expected_request_id = rs485_Ed.modbus_master_read_holding_registers(2, Ed_address, Ed_byte)
+        Timer(RETRY, read_Ed).start()
 
 
 def cb_read_Lu(request_id, exception_code, holding_registers):
@@ -106,19 +145,21 @@ def cb_read_Lu(request_id, exception_code, holding_registers):
     if exception_code == 0:     # success
         Lu_data[addresses[Lu_address]] = holding_registers
         if Lu_address == 3109:
-            pd.DataFrame([process_data(Lu_data)]).set_index("time").to_csv(path_Lu, mode="a", header=False)  # Write Lu data on disk
+            if not warming_up:  # the warm-up spectrum is discarded
+                record = {**process_data(Lu_data), **Lu_state}
+                pd.DataFrame([record]).set_index("time").to_csv(path_Lu, mode="a", header=False)  # Write Lu data on disk
+                _hub.publish("Lu", record)
             Lu_busy = False
         else:
             Lu_address = Lu_address_queue.pop()
             Lu_byte = Lu_byte_queue.pop()
-            Lu_expected_request_id = rs485_Lu.modbus_master_read_holding_registers(1, Lu_address, Lu_byte)
+            read_Lu()
     else:
         if request_id != Lu_expected_request_id:
             print(f"Lu Error: Unexpected request ID ({Lu_expected_request_id})")
         elif exception_code == 6:
             print("Lu sensor is busy")
-        time.sleep(0.256)
-        Lu_expected_request_id = rs485_Lu.modbus_master_read_holding_registers(1, Lu_address, Lu_byte)
+        Timer(RETRY, read_Lu).start()
 
 
 # Thread workers
@@ -143,15 +184,13 @@ def get_Lu(slave_addr=1):
 
 # Main function
 
-def main(point_id, n, out_dir):
-    global rs485_Ed, rs485_Lu, path_Ed, path_Lu
+def setup(hub):
+    """Configure the RS485 devices of a connected `hub` and register the callbacks."""
+    global _hub, rs485_Ed, rs485_Lu
 
-    ipcon = IPConnection() # Create IP connection
-    rs485_Ed = BrickletRS485(UID_Ed, ipcon) # Create device object
-    rs485_Lu = BrickletRS485(UID_Lu, ipcon) # Create device object
-
-    ipcon.connect(HOST, PORT) # Connect to brickd
-    # Don't use device before ipcon is connected
+    _hub = hub
+    rs485_Ed = hub.rs485_Ed
+    rs485_Lu = hub.rs485_Lu
 
     set_configuration(rs485_Ed)     # Set rs485 configuration
     set_configuration(rs485_Lu)     # Set rs485 configuration
@@ -169,22 +208,75 @@ def main(point_id, n, out_dir):
                                cb_write_single_register_Ed)
     rs485_Lu.register_callback(rs485_Lu.CALLBACK_MODBUS_MASTER_WRITE_SINGLE_REGISTER_RESPONSE,
                                cb_write_single_register_Lu)
-    
+
+
+def warm_up():
+    """
+    Measure and discard a first pair of spectra (requires `setup` to have been called).
+
+    The first spectrum of each sensor is read WARM_UP seconds after its trigger;
+    taking it here lets that delay overlap other start-up tasks.
+    """
+    global warming_up
+
+    warming_up = True
+    t_Ed = Thread(target=get_Ed)
+    t_Lu = Thread(target=get_Lu)
+    t_Ed.start()
+    t_Lu.start()
+    t_Ed.join()
+    t_Lu.join()
+    warming_up = False
+
+
+def measure(point_id, n, out_dir, calibrated_dir=None):
+    """
+    Measure `n` pairs of spectra (requires `setup` to have been called).
+
+    If `calibrated_dir` is given, spectra are also calibrated as they are measured.
+    """
+    global path_Ed, path_Lu
+
     # Write headers
     path_Ed = out_dir / f"Es_{point_id}_{pd.Timestamp.now().strftime('%Y%m%dT%H%M')}__RAW.csv"
     path_Lu = out_dir / f"Lw_{point_id}_{pd.Timestamp.now().strftime('%Y%m%dT%H%M')}__RAW.csv"
     with open(path_Ed, "w") as f:
-        f.write("time,integration_time,length,pre_inclination,post_inclination,ordinate\n")
+        f.write(f"{HEADER}\n")
     with open(path_Lu, "w") as f:
-        f.write("time,integration_time,length,pre_inclination,post_inclination,ordinate\n")
-
-    for _ in track(range(n), description="Processing..."):
-        t_Ed = Thread(target=get_Ed)
-        t_Lu = Thread(target=get_Lu)
-        t_Ed.start()
-        t_Lu.start()
-        t_Ed.join()
-        t_Lu.join()
-    print(f"Measured 2x{n} spectra.")
-
-    ipcon.disconnect()
+        f.write(f"{HEADER}\n")
+    calibrations = {}
+    try:
+        if calibrated_dir is not None:
+            for topic, path, sensor_id in (("Ed", path_Ed, sensors["Es"]), ("Lu", path_Lu, sensors["Lw"])):
+                calibrations[topic] = StreamingCalibration(calibrated_path(path, calibrated_dir), sensor_id)
+                _hub.on(topic, calibrations[topic].put)
+
+        for _ in track(range(n), description="Processing..."):
+            t_Ed = Thread(target=get_Ed)
+            t_Lu = Thread(target=get_Lu)
+            t_Ed.start()
+            t_Lu.start()
+            t_Ed.join()
+            t_Lu.join()
+        print(f"Measured 2x{n} spectra.")
+    finally:
+        close_calibrations(calibrations)
+
+
+def close_calibrations(calibrations):
+    """Close every streaming calibration, then raise the first error, if any."""
+    errors = []
+    for topic, calibration in calibrations.items():
+        _hub.off(topic, calibration.put)
+        try:
+            calibration.close()
+        except RuntimeError as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+
+
+def main(point_id, n, out_dir, calibrated_dir=None):
+    with DeviceHub() as hub:
+        setup(hub)
+        measure(point_id, n, out_dir, calibrated_dir)
@@ -7,6 +7,8 @@ from plotly.subplots import make_subplots
 from pvlib.solarposition import get_solarposition
 from scipy.spatial.transform import Rotation as R
 
+from lsw.utils import get_2Dtilt
+
 
 def load_rad_data(path):
     df = pd.read_csv(path, index_col=0, parse_dates=True)
@@ -25,14 +27,6 @@ def normalize_angle(theta):
         return 360 - theta
 
 
-def get_2Dtilt(vector):
-    x, y, z = vector
-    r = np.sqrt(x**2 + y**2 + z**2)
-    theta = np.degrees(np.arccos(z / r))
-    phi = np.degrees(np.arctan2(y, x))
-    return theta, phi
-
-
 def load_ori_data(path):
     path_pos = path.parent / path.name.replace("orientation", "position")
 
@@ -124,7 +118,8 @@ def create_fig(df_rad, df_ori, name):
                         specs=[[{"type": "xy", "colspan": 2, "rowspan": 3}, None, {"type": "polar", "rowspan": 2}],
                                [None, None, None],
                                [None, None, None]])
-    fig = draw_tilt(fig, df_ori)
+    if df_ori is not None:
+        fig = draw_tilt(fig, df_ori)
     fig = draw_spectrum(fig, df_rad)
     fig.update_layout(title_text=name, template="simple_white",
                       width=1600, height=900,
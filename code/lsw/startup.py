@@ -0,0 +1,51 @@
+from threading import Event, Thread
+
+from lsw import main_geo, main_rad
+from lsw.gps_time import main as set_time
+from lsw.hub import DeviceHub
+
+
+def prepare_rad(hub, errors):
+    try:
+        main_rad.setup(hub)
+        main_rad.warm_up()
+    except Exception as e:
+        errors.append(e)    # raised again by the main thread
+
+
+def main(station, n_spectra, out_dir, rotate=True, fix_timeout=None, calibrate=False):
+    """
+    Run a measurement session over a single brickd connection.
+
+    GPS fix acquisition and clock setting overlap with the RS485 configuration
+    and the warm-up of the radiometers. Sun tracking starts as soon as the
+    clock is set, and spectra are measured once the radiometers are ready.
+    If no fix is obtained within `fix_timeout` seconds, spectra are measured
+    without Sun tracking. If `calibrate` is True, spectra are calibrated as
+    they are measured.
+    """
+    hub = DeviceHub()
+    hub.connect()
+
+    stop = Event()
+    errors = []
+    t_geo = None
+    t_rad = Thread(target=prepare_rad, args=(hub, errors))
+    t_rad.start()
+    try:
+        has_fix = set_time(hub, fix_timeout)
+        if rotate and not has_fix:
+            print("Sun tracking disabled (no GPS fix)")
+        elif rotate:
+            t_geo = Thread(target=main_geo.main, args=(station, out_dir / "geo", hub, stop))
+            t_geo.start()
+        t_rad.join()
+        if errors:
+            raise RuntimeError("Radiometers could not be prepared") from errors[0]
+        main_rad.measure(station, n_spectra, out_dir / "rad/raw", out_dir / "rad/calibrated" if calibrate else None)
+    finally:
+        stop.set()
+        t_rad.join()
+        if t_geo is not None:
+            t_geo.join()
+        hub.disconnect()
@@ -0,0 +1,84 @@
+import os
+import struct
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+import numpy as np
+
+
+NAME = "lsw_state"
+MAX_RETRIES = 1000
+HEADER = 2     # sequence number, PID of the owner
+FIELDS = ("x", "y", "z", "w", "theta", "phi", "theta_sun", "latitude", "longitude", "altitude")
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:     # alive, owned by another user
+        return True
+    return True
+
+
+class LatestState:
+    """
+    Latest orientation of the Lu radiometer and position of the buoy, in shared memory.
+
+    The first process opening the buffer creates it (filled with NaN) and
+    removes it on `close`; the others attach to it. A buffer left by a dead
+    owner is replaced by a new one. Access is guarded by a seqlock: the writer
+    increments the sequence number before and after each update, and readers
+    retry while it is odd or has changed during their copy.
+    Writes are serialised by a lock, which only covers threads of one process:
+    a single process (the one running Sun tracking) may write.
+    A read giving up after MAX_RETRIES returns NaN rather than blocking its caller.
+    """
+    def __init__(self, name=NAME):
+        size = 8 * (HEADER + len(FIELDS))
+        while True:
+            try:
+                self._shm = SharedMemory(name, create=True, size=size)
+                self.owner = True
+                break
+            except FileExistsError:
+                self._shm = SharedMemory(name)
+                self.owner = False
+            if self._shm.size >= size and _is_alive(struct.unpack_from("Q", self._shm.buf, 8)[0]):
+                break
+            self._shm.unlink()  # stale buffer
+            self._shm.close()
+        # Opening the buffer registered it with the resource tracker, which would
+        # remove it when this process exits, even if it is not the owner (Python < 3.13).
+        # The buffer is removed by its owner instead, or replaced when stale.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._seq = np.ndarray((1,), dtype=np.uint64, buffer=self._shm.buf)
+        self._values = np.ndarray((len(FIELDS),), dtype=np.float64, buffer=self._shm.buf, offset=8 * HEADER)
+        self._lock = Lock()
+        if self.owner:
+            struct.pack_into("Q", self._shm.buf, 8, os.getpid())
+            self.write(**dict.fromkeys(FIELDS, np.nan))
+
+    def write(self, **values):
+        with self._lock:
+            self._seq[0] += 1
+            for field, value in values.items():
+                self._values[FIELDS.index(field)] = value
+            self._seq[0] += 1
+
+    def read(self):
+        for _ in range(MAX_RETRIES):
+            seq = self._seq[0]
+            values = self._values.copy()
+            if seq % 2 == 0 and self._seq[0] == seq:
+                return dict(zip(FIELDS, values.tolist()))
+        return dict.fromkeys(FIELDS, np.nan)
+
+    def close(self):
+        del self._seq, self._values     # release the buffer before closing it
+        self._shm.close()
+        if self.owner:
+            resource_tracker.register(self._shm._name, "shared_memory")   # unregistered by unlink
+            self._shm.unlink()
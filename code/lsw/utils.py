@@ -1,6 +1,8 @@
 import struct
 from pathlib import Path
 
+import numpy as np
+
 root = Path(__file__).resolve().parent
 
 # GEO
@@ -24,6 +26,14 @@ def normalize_angle(theta):
         return 360 - theta
 
 
+def get_2Dtilt(vector):
+    x, y, z = vector
+    r = np.sqrt(x**2 + y**2 + z**2)
+    theta = np.degrees(np.arccos(z / r))
+    phi = np.degrees(np.arctan2(y, x))
+    return theta, phi
+
+
 # RAD
 
 addresses = {